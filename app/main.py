@@ -1,61 +1,172 @@
 import logging
+import time
+from typing import Callable, Optional
 
-from make87_messages.core.header_pb2 import Header
 import make87
 import av
-from datetime import datetime, timedelta
 
 from make87_messages.video.any_pb2 import FrameAny
-from make87_messages.video.frame_av1_pb2 import FrameAV1
-from make87_messages.video.frame_h264_pb2 import FrameH264
-from make87_messages.video.frame_h265_pb2 import FrameH265
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-# Generic function for encoding frames
-def encode_frame(codec, header, packet: av.Packet, width: int, height: int) -> FrameAny:
-    codec_classes = {
-        "h264": ("h264", FrameH264),
-        "hevc": ("h265", FrameH265),
-        "av1": ("av1", FrameAV1),
-    }
-
-    if codec not in codec_classes:
-        raise ValueError(f"Unsupported codec: {codec}")
-
-    codec_field, codec_class = codec_classes[codec]
-    sub_message = codec_class(
-        header=header,
-        data=bytes(packet),
-        width=width,
-        height=height,
-        is_keyframe=packet.is_keyframe,
-        pts=packet.pts,
-        dts=packet.dts,
-        duration=packet.duration,
-        time_base=codec_class.Fraction(
-            num=packet.time_base.numerator,
-            den=packet.time_base.denominator,
-        ),
-    )
-
-    return FrameAny(header=header, **{codec_field: sub_message})
-
-
-def check_annex_b_format(packet: av.Packet):
+# Maps PyAV codec names to the FrameAny oneof field
+_CODEC_MAP = {
+    "h264": "h264",
+    "hevc": "h265",
+    "av1": "av1",
+}
+
+# FFmpeg demuxer options for the RTSP input: interleaved TCP transport, no input buffering,
+# bounded reordering delay and a 5 s socket timeout (in microseconds) to detect dead connections
+_RTSP_OPTIONS = {
+    "rtsp_transport": "tcp",
+    "fflags": "nobuffer+discardcorrupt",
+    "flags": "low_delay",
+    "max_delay": "100000",
+    "reorder_queue_size": "0",
+    "timeout": "5000000",
+}
+
+# Reconnect backoff: the delay doubles per consecutive failure up to the cap, and failures are
+# logged as errors once the threshold is reached. A connection that stays up for at least
+# _RECONNECT_HEALTHY_AFTER_S resets the backoff.
+_RECONNECT_DELAY_S = 0.5
+_RECONNECT_MAX_DELAY_S = 30.0
+_RECONNECT_ERROR_AFTER = 10
+_RECONNECT_HEALTHY_AFTER_S = 30.0
+
+# RTSP 401/403/404 replies mean wrong credentials or URI suffix; retrying cannot fix those
+_FATAL_RTSP_ERRORS = (
+    av.error.HTTPUnauthorizedError,
+    av.error.HTTPForbiddenError,
+    av.error.HTTPNotFoundError,
+)
+
+
+# Generic function for encoding frames; fills the reused message in place instead of allocating new ones.
+# Stream-invariant fields (entity_path, width, height, time_base) are set once by the caller, which also
+# passes in the pre-bound FromNanoseconds setters of both header timestamps.
+def encode_frame(
+    message: FrameAny,
+    sub_message,
+    set_timestamp: Callable[[int], None],
+    set_sub_timestamp: Callable[[int], None],
+    timestamp_ns: int,
+    data: bytes,
+    is_keyframe: bool,
+    pts: int,
+    dts: int,
+    duration: Optional[int],
+) -> FrameAny:
+    set_timestamp(timestamp_ns)
+    set_sub_timestamp(timestamp_ns)
+    sub_message.data = data
+    sub_message.is_keyframe = is_keyframe
+    sub_message.pts = pts
+    sub_message.dts = dts
+    # PyAV reports AV_NOPTS_VALUE as None; assigning None to a proto field raises, so publish the default
+    sub_message.duration = duration if duration is not None else 0
+    return message
+
+
+def check_annex_b_format(data: memoryview):
     """
     Check if the packet is in Annex B format.
     This is typically used for H.264 streams.
     """
-    # Check if the packet starts with the Annex B start code
-    data = bytes(packet)  # get the raw packet bytes
-    if not (data.startswith(b"\x00\x00\x00\x01") or data.startswith(b"\x00\x00\x01")):
+    # Check if the packet starts with the 4-byte (00 00 00 01) or 3-byte (00 00 01) Annex B start code
+    head = int.from_bytes(data[:4], "little")
+    if head != 0x01000000 and (head & 0xFFFFFF) != 0x010000:
         raise NotImplementedError("Only Annex B format is supported for H.264/H.265 streams.")
 
 
+def _describe_error(e: Exception) -> str:
+    # str() of an FFmpegError includes the av.open URL, which carries the camera password
+    return f"{type(e).__name__} (errno {getattr(e, 'errno', None)}: {getattr(e, 'strerror', None)})"
+
+
+def publish_stream(container, stream_index: int, message: FrameAny, publish) -> None:
+    """
+    Demux the requested video stream of an open container and publish every packet.
+    Returns when the stream ends; FFmpeg errors from a dropped connection propagate to the caller.
+    """
+    # Reference timestamp in true UTC (Unix epoch ns), re-synced on every connection since PTS restart
+    stream_start_ns = time.time_ns()
+
+    # Find the requested video stream; negative indices would wrap around the stream list
+    if stream_index < 0:
+        raise ValueError(f"Stream index {stream_index} not found.")
+    try:
+        video_stream = container.streams[stream_index]
+    except IndexError:
+        raise ValueError(f"Stream index {stream_index} not found.") from None
+    if video_stream.type != "video":
+        raise ValueError(f"Stream index {stream_index} is not a video stream.")
+
+    # Print stream information
+    stream_info = {
+        "Index": video_stream.index,
+        "Codec": video_stream.codec_context.name,
+        "Resolution": f"{video_stream.width}x{video_stream.height}",
+        "Pixel Format": video_stream.pix_fmt,
+        "Frame Rate": str(video_stream.average_rate),
+    }
+    logger.info("Stream Attributes: %s", stream_info)
+
+    # Validate codec support
+    codec_name = video_stream.codec_context.name
+    if codec_name not in _CODEC_MAP:
+        raise ValueError(f"Unsupported codec: {codec_name}")
+    codec_field = _CODEC_MAP[codec_name]
+
+    # Stream metadata
+    start_pts = video_stream.start_time or 0  # Handle missing start_time
+    tb_num, tb_den = video_stream.time_base.numerator, video_stream.time_base.denominator
+
+    # Select the codec in the FrameAny oneof and set the stream-invariant sub-message fields
+    sub_message = getattr(message, codec_field)
+    sub_message.SetInParent()
+    sub_message.header.entity_path = message.header.entity_path
+    sub_message.width = video_stream.width
+    sub_message.height = video_stream.height
+    sub_message.time_base.num = tb_num
+    sub_message.time_base.den = tb_den
+
+    # Only H.264/H.265 need the Annex B check; resolved once instead of per packet
+    validated_annex_b = codec_name not in {"h264", "hevc"}
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    # The header timestamps belong to the reused message and live for the whole connection
+    set_timestamp = message.header.timestamp.FromNanoseconds
+    set_sub_timestamp = sub_message.header.timestamp.FromNanoseconds
+
+    for packet in container.demux(video_stream):
+        # Read each packet attribute once; every access crosses into PyAV
+        dts = packet.dts
+        pts = packet.pts
+        if dts is None or pts is None:
+            continue  # Skip invalid frames; a timestamp cannot be computed without pts
+        is_keyframe = packet.is_keyframe
+        duration = packet.duration
+
+        if not validated_annex_b:
+            # Check for Annex B format
+            check_annex_b_format(memoryview(packet))
+            validated_annex_b = True
+
+        # Compute timestamps in integer nanoseconds to avoid float drift
+        ts_ns = stream_start_ns + (pts - start_pts) * tb_num * 1_000_000_000 // tb_den
+        data = bytes(packet)
+
+        if debug_enabled:
+            logger.debug("Packet pts=%d dts=%d size=%d keyframe=%s", pts, dts, len(data), is_keyframe)
+
+        # Encode and publish the frame
+        publish(encode_frame(message, sub_message, set_timestamp, set_sub_timestamp, ts_ns, data, is_keyframe, pts, dts, duration))
+
+
 def main():
     make87.initialize()
     topic = make87.get_publisher(name="VIDEO_DATA", message_type=FrameAny)
@@ -71,55 +182,42 @@ def main():
     }
 
     stream_uri = f"rtsp://{config['username']}:{config['password']}@{config['ip']}:{config['port']}/{config['suffix']}"
-    with av.open(stream_uri) as container:
-        stream_start = datetime.now()  # Reference timestamp
-
-        # Find the requested video stream
-        video_stream = next(iter(s for s in container.streams if s.index == config["stream_index"]), None)
-        if video_stream is None:
-            raise ValueError(f"Stream index {config['stream_index']} not found.")
-
-        # Print stream information
-        stream_info = {
-            "Index": video_stream.index,
-            "Codec": video_stream.codec_context.name,
-            "Resolution": f"{video_stream.width}x{video_stream.height}",
-            "Pixel Format": video_stream.pix_fmt,
-            "Frame Rate": str(video_stream.average_rate),
-        }
-        logger.info("Stream Attributes:", stream_info)
-
-        # Validate codec support
-        codec_name = video_stream.codec_context.name
-        if codec_name not in {"h264", "hevc", "av1"}:
-            raise ValueError(f"Unsupported codec: {codec_name}")
-
-        # Stream metadata
-        start_pts = video_stream.start_time or 0  # Handle missing start_time
-        time_base = float(video_stream.time_base)
-        width, height = video_stream.width, video_stream.height
-
-        validated_annex_b = False
-
-        for packet in container.demux(video_stream):
-            if packet.dts is None:
-                continue  # Skip invalid frames
-
-            if not validated_annex_b:
-                if codec_name in {"h264", "hevc"}:
-                    # Check for Annex B format
-                    check_annex_b_format(packet)
-                validated_annex_b = True
-
-            # Compute timestamps
-            relative_timestamp = (packet.pts - start_pts) * time_base
-            absolute_timestamp = stream_start + timedelta(seconds=relative_timestamp)
-
-            header = Header(entity_path=f"/camera/{config['ip']}/{config['suffix']}")
-            header.timestamp.FromDatetime(absolute_timestamp)
-
-            # Encode and publish the frame
-            topic.publish(encode_frame(codec_name, header, packet, width, height))
+
+    # Single message reused for every packet and across reconnects; publish() serializes synchronously
+    message = FrameAny()
+    message.header.entity_path = f"/camera/{config['ip']}/{config['suffix']}"
+    publish = topic.publish  # Bound once to skip the attribute lookup per packet
+
+    # Reconnect whenever the camera is unreachable, drops the connection or ends the stream,
+    # including before the first connection (camera still booting). Only configuration errors are fatal.
+    redacted_uri = f"rtsp://{config['username']}:***@{config['ip']}:{config['port']}/{config['suffix']}"
+    failures = 0
+    while True:
+        opened_at = None
+        try:
+            with av.open(stream_uri, options=_RTSP_OPTIONS) as container:
+                opened_at = time.monotonic()
+                publish_stream(container, config["stream_index"], message, publish)
+            reason = "stream ended"
+        except _FATAL_RTSP_ERRORS as e:
+            raise ConnectionError(f"Failed to open RTSP stream {redacted_uri}: {_describe_error(e)}") from None
+        except (av.FFmpegError, OSError) as e:
+            reason = _describe_error(e)
+
+        if opened_at is not None and time.monotonic() - opened_at >= _RECONNECT_HEALTHY_AFTER_S:
+            failures = 0
+        failures += 1
+        delay = min(_RECONNECT_DELAY_S * 2 ** min(failures - 1, 16), _RECONNECT_MAX_DELAY_S)
+        level = logging.ERROR if failures >= _RECONNECT_ERROR_AFTER else logging.WARNING
+        logger.log(
+            level,
+            "RTSP stream %s interrupted: %s (%d consecutive failures), reconnecting in %.1f s",
+            redacted_uri,
+            reason,
+            failures,
+            delay,
+        )
+        time.sleep(delay)
 
 
 if __name__ == "__main__":